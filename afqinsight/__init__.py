@@ -1,5 +1,3 @@
-from __future__ import absolute_import, division, print_function
-
 from . import datasets  # noqa
 from . import plot  # noqa
 from . import utils  # noqa
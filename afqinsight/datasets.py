@@ -1,7 +1,6 @@
 """
 Generate samples of synthetic data sets or extract AFQ data
 """
-from __future__ import absolute_import, division, print_function
 
 import numpy as np
 import os.path as op
@@ -289,7 +288,7 @@ def make_classification(
 
     # Initialize X and y
     X = np.zeros((n_samples, n_features))
-    y = np.zeros(n_samples, dtype=np.int)
+    y = np.zeros(n_samples, dtype=int)
 
     # Build the polytope whose vertices become cluster centroids
     centroids = _generate_hypercube(n_clusters, n_informative, generator).astype(float)
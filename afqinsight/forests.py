@@ -1,5 +1,3 @@
-from __future__ import absolute_import, division, print_function
-
 import numpy as np
 from collections import defaultdict
 from sklearn.ensemble import RandomForestClassifier, RandomForestRegressor
@@ -56,8 +54,10 @@ def get_random_forest_group_scores(
     group_labels : sequence of tuples
         tuples of feature labels at any level(s) of the MultiIndex for `x`
 
-    all_label_sets : ndarray of sets
-        Array of sets of labels for each column of `x`
+    all_label_sets : ndarray of sets, LabelCodes, or pandas.MultiIndex
+        Array of sets of labels for each column of `x`, the integer
+        encoding of those labels returned by `multicol2codes`, or the
+        MultiIndex columns of `x`
 
     _type : 'classifier' or 'regressor'
         Type of random forest to use: classifier or regressor
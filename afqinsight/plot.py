@@ -1,7 +1,6 @@
 """
 Create diagnostic plots of AFQ-Insight output
 """
-from __future__ import absolute_import, division, print_function
 
 import itertools
 import os.path as op
@@ -1,7 +1,6 @@
 """
 Define custom proximal operators for use with copt package
 """
-from __future__ import absolute_import, division, print_function
 
 import numpy as np
 
@@ -14,7 +13,7 @@ def registered(fn):
 
 
 @registered
-class SparseGroupL1(object):
+class SparseGroupL1:
     """Sparse group lasso penalty class for use with openopt/copt package.
 
     Implements the sparse group lasso penalty [1]_
@@ -1,5 +1,3 @@
-from __future__ import absolute_import, division, print_function
-
 import afqinsight as afqi
 import numpy as np
 import os.path as op
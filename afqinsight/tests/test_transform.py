@@ -1,5 +1,3 @@
-from __future__ import absolute_import, division, print_function
-
 import afqinsight as afqi
 import numpy as np
 import os.path as op
@@ -27,10 +25,152 @@ def test_AFQFeatureTransformer():
     assert bias_idx == 16000
 
 
+def test_AFQFeatureTransformer_missing_tract():
+    nodes_path = op.join(test_data_path, "nodes.csv")
+    nodes = pd.read_csv(nodes_path)
+    missing = (nodes["subjectID"] == "subject_003") & (
+        nodes["tractID"] == "Left Uncinate"
+    )
+
+    transformer = afqi.AFQFeatureTransformer()
+    x, groups, cols, bias_idx = transformer.transform(nodes[~missing])
+    x_ref = np.load(op.join(test_data_path, "test_transform_x.npy"))
+
+    assert x.shape == x_ref.shape
+    assert not np.any(np.isnan(x))
+
+    tract_cols = np.asarray(cols.get_level_values("tractID") == "Left Uncinate")
+    other_subjects = np.arange(x.shape[0]) != 3
+    assert np.allclose(
+        x[3, :-1][tract_cols],
+        np.median(x_ref[other_subjects, :-1][:, tract_cols], axis=0),
+    )
+    assert np.allclose(x[other_subjects], x_ref[other_subjects])
+
+
+def test_AFQFeatureTransformer_missing_node():
+    # Node 3 is missing for every subject, so the nodes are not equally spaced
+    df = pd.DataFrame(
+        {
+            "subjectID": ["a"] * 4,
+            "tractID": ["t"] * 4,
+            "nodeID": [0, 1, 2, 4],
+            "fa": [0.0, 0.0, np.nan, 3.0],
+        }
+    )
+
+    transformer = afqi.AFQFeatureTransformer()
+
+    # Without extrapolation, the nodes are treated as equally spaced
+    x, _, _, _ = transformer.transform(df, add_bias_feature=False)
+    assert np.allclose(x, [[0.0, 0.0, 1.5, 3.0]])
+
+    # With extrapolation, the nodeID values give the node positions
+    x, _, _, _ = transformer.transform(df, extrapolate=True, add_bias_feature=False)
+    assert np.allclose(x, [[0.0, 0.0, 1.0, 3.0]])
+
+
+def test_AFQFeatureTransformer_categorical_subjects():
+    nodes_path = op.join(test_data_path, "nodes.csv")
+    nodes = pd.read_csv(nodes_path)
+    subjects = sorted(nodes["subjectID"].unique())
+    categorical = nodes.assign(
+        subjectID=pd.Categorical(nodes["subjectID"], categories=subjects[::-1])
+    )
+
+    transformer = afqi.AFQFeatureTransformer()
+    x_ref, _, columns_ref, _ = transformer.transform(nodes)
+    x, _, columns, _ = transformer.transform(categorical)
+
+    # Rows follow the order of the categories
+    assert columns.equals(columns_ref)
+    assert np.allclose(x, x_ref[::-1])
+
+
+def test_AFQFeatureTransformer_missing_subject():
+    nodes_path = op.join(test_data_path, "nodes.csv")
+    nodes = pd.read_csv(nodes_path)
+    categorical = nodes.assign(subjectID=pd.Categorical(nodes["subjectID"]))
+    categorical.loc[categorical.index[:5], "subjectID"] = np.nan
+
+    transformer = afqi.AFQFeatureTransformer()
+    x_ref, _, columns_ref, _ = transformer.transform(nodes.iloc[5:])
+    x, _, columns, _ = transformer.transform(categorical)
+
+    # Rows without a subjectID are dropped
+    assert columns.equals(columns_ref)
+    assert np.allclose(x, x_ref)
+
+
+def test_AFQFeatureTransformer_categorical_tracts():
+    nodes_path = op.join(test_data_path, "nodes.csv")
+    nodes = pd.read_csv(nodes_path)
+    tracts = sorted(nodes["tractID"].unique())
+    categorical = nodes.assign(
+        tractID=pd.Categorical(nodes["tractID"], categories=tracts[::-1])
+    )
+
+    transformer = afqi.AFQFeatureTransformer()
+    x_ref, _, columns_ref, _ = transformer.transform(nodes)
+    x, _, columns, _ = transformer.transform(categorical)
+
+    # Columns follow the order of the categories
+    assert list(columns.levels[1]) == tracts[::-1]
+    assert list(columns.get_level_values("tractID").unique()) == tracts[::-1]
+    assert np.allclose(x[:, :-1], x_ref[:, columns_ref.get_indexer(list(columns))])
+
+
+def test_AFQFeatureTransformer_duplicate_rows():
+    nodes_path = op.join(test_data_path, "nodes.csv")
+    nodes = pd.read_csv(nodes_path)
+    extra = nodes.iloc[:3].copy()
+    extra["fa"] = 99.0
+    extra.loc[extra.index[1], "md"] = np.nan
+    duplicated = pd.concat([nodes, extra], ignore_index=True)
+
+    # Duplicate rows are averaged, ignoring NaN values, as pd.pivot_table did
+    averaged = nodes.copy()
+    averaged.loc[averaged.index[:3], "fa"] = (nodes["fa"].iloc[:3] + 99.0) / 2
+
+    transformer = afqi.AFQFeatureTransformer()
+    x_ref, _, columns_ref, _ = transformer.transform(averaged)
+    x, _, columns, _ = transformer.transform(duplicated)
+
+    assert columns.equals(columns_ref)
+    assert np.allclose(x, x_ref)
+
+
 def test_isiterable():
     assert afqi.transform.isiterable(range(10))
     assert not afqi.transform.isiterable(5)
     assert afqi.transform.isiterable(np.arange(10))
+    assert not afqi.transform.isiterable(np.array(5))
+    assert afqi.transform.isiterable(x for x in range(10))
+    assert not afqi.transform.isiterable(list)
+    assert not afqi.transform.isiterable(dict)
+
+
+def test_GroupExtractor():
+    x = np.arange(20).reshape(2, 10)
+    groups = np.repeat(np.arange(5), 2)
+
+    extractor = afqi.GroupExtractor(extract=[1, 3], groups=groups)
+    x_extract = extractor.fit_transform(x)
+    assert np.all(x_extract == x[:, [2, 3, 6, 7]])
+    assert np.all(extractor.mask_ == np.isin(groups, [1, 3]))
+
+    extractor = afqi.GroupExtractor(extract=2, groups=groups)
+    assert np.all(extractor.transform(x) == x[:, [4, 5]])
+
+    extractor = afqi.GroupExtractor()
+    assert np.all(extractor.fit_transform(x) == x)
+
+    # Calling transform without fit doesn't freeze the parameters
+    extractor = afqi.GroupExtractor(extract=1, groups=groups)
+    assert np.all(extractor.transform(x) == x[:, [2, 3]])
+    assert not hasattr(extractor, "mask_")
+    extractor.set_params(extract=3)
+    assert np.all(extractor.transform(x) == x[:, [6, 7]])
 
 
 def test_remove_group():
@@ -61,6 +201,13 @@ def test_remove_groups():
 
     assert np.all(x_removed == x_removed_ref)
 
+    # Labels may be given as any iterable, e.g. a generator
+    labels = [("Callosum Forceps Major",), ("Uncinate",), ("fa",)]
+    x_removed = afqi.remove_groups(
+        x_ref[:, :-1], (label for label in labels), label_sets_ref
+    )
+    assert np.all(x_removed == x_removed_ref)
+
 
 def test_select_group():
     x_ref = np.load(op.join(test_data_path, "test_transform_x.npy"))
@@ -91,6 +238,13 @@ def test_select_groups():
 
     assert np.all(x_select == x_select_ref)
 
+    # Labels may be given as any iterable, e.g. a generator
+    labels = [("Callosum Forceps Major",), ("Uncinate",), ("fa",)]
+    x_select = afqi.select_groups(
+        x_ref[:, :-1], (label for label in labels), label_sets_ref
+    )
+    assert np.all(x_select == x_select_ref)
+
 
 def test_shuffle_group():
     x_ref = np.load(op.join(test_data_path, "test_transform_x.npy"))
@@ -98,6 +252,7 @@ def test_shuffle_group():
         op.join(test_data_path, "test_multicol2sets_label_sets.npy"), allow_pickle=True
     )
 
+    global_state = np.random.get_state()[1].copy()
     x_shuffle = afqi.shuffle_group(
         x_ref[:, :-1], ("Corticospinal",), label_sets_ref, random_seed=42
     )
@@ -105,6 +260,7 @@ def test_shuffle_group():
     x_shuffle_ref = np.load(op.join(test_data_path, "test_shuffle_group_x.npy"))
 
     assert np.all(x_shuffle == x_shuffle_ref)
+    assert np.all(np.random.get_state()[1] == global_state)
 
 
 def test_multicol2sets():
@@ -118,3 +274,191 @@ def test_multicol2sets():
     )
 
     assert np.all(label_sets == label_sets_ref)
+
+
+def test_interpolate_rows():
+    nan = np.nan
+    fibers = np.array(
+        [
+            [nan, 1.0, nan, 3.0, 4.0, nan],
+            [nan, nan, 2.0, nan, nan, nan],
+            [nan, nan, nan, nan, nan, nan],
+            [0.0, 1.0, 2.0, 3.0, 4.0, 5.0],
+        ]
+    )
+    nodes = np.arange(6, dtype=np.float64)
+
+    interpolated = fibers.copy()
+    afqi.transform._interpolate_rows(interpolated, nodes, False)
+    interpolated_ref = np.array(
+        [
+            [1.0, 1.0, 2.0, 3.0, 4.0, 4.0],
+            [2.0, 2.0, 2.0, 2.0, 2.0, 2.0],
+            [nan, nan, nan, nan, nan, nan],
+            [0.0, 1.0, 2.0, 3.0, 4.0, 5.0],
+        ]
+    )
+    assert np.allclose(interpolated, interpolated_ref, equal_nan=True)
+
+    extrapolated = fibers.copy()
+    afqi.transform._interpolate_rows(extrapolated, nodes, True)
+    extrapolated_ref = np.array(
+        [
+            [0.0, 1.0, 2.0, 3.0, 4.0, 5.0],
+            [2.0, 2.0, 2.0, 2.0, 2.0, 2.0],
+            [nan, nan, nan, nan, nan, nan],
+            [0.0, 1.0, 2.0, 3.0, 4.0, 5.0],
+        ]
+    )
+    assert np.allclose(extrapolated, extrapolated_ref, equal_nan=True)
+    assert np.isnan(fibers[0, 0])
+
+
+def test_multicol2codes():
+    x_ref = np.load(op.join(test_data_path, "test_transform_x.npy"))[:, :-1]
+    cols = pd.read_hdf(
+        op.join(test_data_path, "test_transform_cols.h5"), key="cols"
+    ).index
+
+    label_codes = afqi.multicol2codes(cols)
+    assert label_codes.codes.shape == (len(cols), len(cols.names) + 1)
+    assert len(label_codes.code_maps) == len(cols.names) + 1
+    assert "Uncinate" in label_codes.code_maps[-1]
+
+    label_sets_ref = np.load(
+        op.join(test_data_path, "test_multicol2sets_label_sets.npy"), allow_pickle=True
+    )
+
+    labels = [("Callosum Forceps Major",), ("Uncinate",), ("fa",)]
+    # With tract symmetry, nodeIDs are labeled by strings in both encodings
+    node_labels = [("fa", "5"), ("5",), ("fa", 5), (5,)]
+    for label in (
+        labels + node_labels + [("Left Uncinate", "md"), ("Uncinate", "not a label")]
+    ):
+        assert np.array_equal(
+            afqi.select_group(x_ref, label, label_codes),
+            afqi.select_group(x_ref, label, label_sets_ref),
+        )
+        assert np.array_equal(
+            afqi.remove_group(x_ref, label, label_codes),
+            afqi.remove_group(x_ref, label, label_sets_ref),
+        )
+
+    assert afqi.select_group(x_ref, ("fa", "5"), label_codes).shape == (
+        len(x_ref),
+        len(cols.levels[1]),
+    )
+    assert afqi.select_group(x_ref, ("fa", 5), label_codes).size == 0
+
+    for group_labels in [labels, node_labels]:
+        assert np.array_equal(
+            afqi.select_groups(x_ref, group_labels, label_codes),
+            afqi.select_groups(x_ref, group_labels, label_sets_ref),
+        )
+    assert np.array_equal(
+        afqi.remove_groups(x_ref, labels, label_codes),
+        afqi.remove_groups(x_ref, labels, label_sets_ref),
+    )
+
+    # The encoding is cached on the MultiIndex, which can be used directly
+    assert afqi.multicol2codes(cols) is label_codes
+    assert afqi.multicol2codes(cols, tract_symmetry=False) is not label_codes
+    assert not label_codes.codes.flags.writeable
+    assert np.array_equal(
+        afqi.select_groups(x_ref, labels, cols),
+        afqi.select_groups(x_ref, labels, label_sets_ref),
+    )
+    assert np.array_equal(
+        afqi.select_group(x_ref, ("fa", "5"), cols),
+        afqi.select_group(x_ref, ("fa", "5"), label_sets_ref),
+    )
+
+    # Changing the levels invalidates the cached encoding. Rather than rely
+    # on in-place setters, we give new columns the stale cache directly.
+    upper = cols.set_levels(cols.levels[0].str.upper(), level=0)
+    upper._afq_label_codes = cols._afq_label_codes
+    assert afqi.multicol2codes(upper) is not label_codes
+    assert afqi.select_group(x_ref, ("fa",), upper).size == 0
+    assert np.array_equal(
+        afqi.select_group(x_ref, ("FA",), upper),
+        afqi.select_group(x_ref, ("fa",), label_sets_ref),
+    )
+
+
+def test_multicol2dicts():
+    cols = pd.read_hdf(
+        op.join(test_data_path, "test_transform_cols.h5"), key="cols"
+    ).index
+
+    col_dicts = afqi.multicol2dicts(cols)
+    assert len(col_dicts) == len(cols)
+    assert list(col_dicts.dtype.names) == cols.names + ["symmetrized_tractID"]
+
+    for idx in [0, 2345, len(cols) - 1]:
+        metric, tract, node = cols[idx]
+        assert col_dicts[idx]["metric"] == metric
+        assert col_dicts[idx]["tractID"] == tract
+        assert col_dicts[idx]["nodeID"] == node
+        assert col_dicts[idx]["symmetrized_tractID"] == tract.replace(
+            "Left ", ""
+        ).replace("Right ", "")
+
+    col_dicts = afqi.multicol2dicts(cols, tract_symmetry=False)
+    assert list(col_dicts.dtype.names) == cols.names
+
+
+def test_sort_features():
+    features = ["a", "b", "c", "d", "e"]
+    scores = [0.5, -2.0, 0.0, 2.0, -0.5]
+
+    sorted_features = afqi.sort_features(features, scores)
+    assert [feat for feat, _ in sorted_features] == ["b", "d", "a", "e", "c"]
+    assert [score for _, score in sorted_features] == [-2.0, 2.0, 0.5, -0.5, 0.0]
+
+    # Non-list inputs, including a Series whose index is not 0, 1, 2, ...
+    series = pd.Series(features, index=[10, 11, 12, 13, 14])
+    sorted_features = afqi.sort_features(series, (score for score in scores))
+    assert [feat for feat, _ in sorted_features] == ["b", "d", "a", "e", "c"]
+    assert all(type(score) is float for _, score in sorted_features)
+
+
+def test_unfold_beta_hat_by_metrics():
+    cols = pd.read_hdf(
+        op.join(test_data_path, "test_transform_cols.h5"), key="cols"
+    ).index
+    beta_hat = np.arange(len(cols), dtype=np.float64)
+
+    betas_by_groups = afqi.beta_hat_by_groups(beta_hat, cols)
+    assert list(betas_by_groups.keys()) == list(cols.levels[1])
+    assert np.all(
+        betas_by_groups["Left Uncinate"]["fa"]
+        == beta_hat[(cols.codes[0] == 3) & (cols.codes[1] == 10)]
+    )
+
+    unfolded = afqi.unfold_beta_hat_by_metrics(beta_hat, cols)
+    assert list(unfolded.keys()) == list(cols.levels[0])
+    for metric, betas in unfolded.items():
+        betas_ref = np.concatenate(
+            [
+                betas_by_groups[tract][metric]
+                for tract in afqi.utils.canonical_tract_names
+            ]
+        )
+        assert np.all(betas == betas_ref)
+
+
+def test_unfold_beta_hat_by_metrics_repeated_tract():
+    cols = pd.read_hdf(
+        op.join(test_data_path, "test_transform_cols.h5"), key="cols"
+    ).index
+    beta_hat = np.arange(len(cols), dtype=np.float64)
+    betas_by_groups = afqi.beta_hat_by_groups(beta_hat, cols)
+
+    # A repeated tract contributes its coefficients once per entry
+    tract_names = ["Left Uncinate", "Left Uncinate"]
+    unfolded = afqi.unfold_beta_hat_by_metrics(beta_hat, cols, tract_names)
+    for metric, betas in unfolded.items():
+        betas_ref = np.concatenate(
+            [betas_by_groups[tract][metric] for tract in tract_names]
+        )
+        assert np.all(betas == betas_ref)
@@ -1,13 +1,14 @@
 """
 Extract, transform, select, and shuffle AFQ data
 """
-from __future__ import absolute_import, division, print_function
 
+import numba
 import numpy as np
 import pandas as pd
-from collections import OrderedDict
-from scipy.interpolate import interp1d
+import warnings
+from collections import OrderedDict, namedtuple
 from sklearn.base import BaseEstimator, TransformerMixin
+from sklearn.utils import check_random_state
 
 from .utils import canonical_tract_names
 
@@ -19,8 +20,12 @@ def registered(fn):
     return fn
 
 
+LabelCodes = namedtuple("LabelCodes", "codes code_maps")
+__all__.append("LabelCodes")
+
+
 @registered
-class AFQFeatureTransformer(object):
+class AFQFeatureTransformer:
     """Transforms AFQ data from an input dataframe into a feature matrix
 
     Using an object interface for eventual inclusion into sklearn Pipelines
@@ -38,10 +43,11 @@ class AFQFeatureTransformer(object):
             input AFQ dataframe
 
         extrapolate : bool, default=False
-            If True, use column-wise linear interpolation/extrapolation
-            for missing metric values. If False, use pandas built-in
-            `interpolate` method, which uses interpolation for interior points
-            and forward(back)-fill for exterior points.
+            If True, use linear interpolation/extrapolation along each fiber
+            for missing metric values, using the nodeID values as the node
+            positions. If False, use linear interpolation for interior points
+            and forward(back)-fill for exterior points, treating the nodes as
+            equally spaced regardless of their nodeID values.
 
         add_bias_feature : bool, default=True
             If True, add a bias (i.e. intercept) feature to the feature matrix
@@ -63,108 +69,244 @@ class AFQFeatureTransformer(object):
         bias_index : int
             the index of the bias feature
         """
-        # We'd like to interpolate the missing values, but first we need to
-        # structure the data frame so that it does not interpolate from other
-        # subjects, tracts, or metrics. It should only interpolate from nearby
-        # nodes. So we want the nodeID as the row index and all the other
-        # stuff as columns . After that we can interpolate along each column.
-        by_node_idx = pd.pivot_table(
-            data=df.melt(id_vars=["subjectID", "tractID", "nodeID"], var_name="metric"),
-            index="nodeID",
-            columns=["metric", "tractID", "subjectID"],
-            values="value",
+        # AFQ data is inherently a regular four-dimensional tensor with
+        # dimensions (subject, metric, tract, node). Rather than pivoting
+        # into a large MultiIndexed dataframe and stacking/unstacking to
+        # reorder the levels, we scatter the values directly into a
+        # preallocated tensor. Any (subject, tract) combinations that are
+        # missing from the input dataframe remain NaN. We don't melt the
+        # dataframe first; each row fills in all metrics at once.
+        id_cols = ["subjectID", "tractID", "nodeID"]
+        metric_cols = [col for col in df.columns if col not in id_cols]
+
+        # Rows with a missing ID can't be placed in the tensor, so we drop
+        # them, as `pd.pivot_table` did for NaN group keys
+        df = df.dropna(subset=id_cols)
+
+        # Categorical ID columns keep their category order and the others
+        # are sorted by value, as with `pd.pivot_table`. This orders the rows
+        # by subject and the columns by tract and node.
+        subjects, subject_idx = _unique_ids(df["subjectID"])
+        tracts, tract_idx = _unique_ids(df["tractID"])
+        nodes, node_idx = _unique_ids(df["nodeID"])
+        metrics, metric_idx = np.unique(metric_cols, return_inverse=True)
+
+        n_subjects, n_metrics = len(subjects), len(metrics)
+        n_tracts, n_nodes = len(tracts), len(nodes)
+
+        index = (
+            subject_idx[:, np.newaxis],
+            metric_idx[np.newaxis, :],
+            tract_idx[:, np.newaxis],
+            node_idx[:, np.newaxis],
         )
-
-        if not extrapolate:
-            # We could use the built-in `.interpolate` method. This has some
-            # unexpected behavior when the NaN values are at the beginning or
-            # end of a series. For NaN values at the end of the series, it
-            # forward fills the most recent valid value. And for NaN values
-            # at the beginning of the series, it back fills the next valid
-            # value. For now, we accept this behavior because the execution
-            # time is much, much faster than doing column-wise linear
-            # extrapolation
-            interpolated = by_node_idx.interpolate(
-                method="linear", limit_direction="both"
-            )
+        values = df[metric_cols].to_numpy(dtype=np.float64)
+        shape = (n_subjects, n_metrics, n_tracts, n_nodes)
+
+        if df.duplicated(id_cols).any():
+            # A plain scatter would keep only the last of any duplicate
+            # (subject, tract, node) rows. Instead, we average them, ignoring
+            # NaN values, as `pd.pivot_table` did.
+            valid = ~np.isnan(values)
+            sums = np.zeros(shape)
+            counts = np.zeros(shape)
+            np.add.at(sums, index, np.where(valid, values, 0.0))
+            np.add.at(counts, index, valid)
+            with np.errstate(invalid="ignore"):
+                tensor = sums / counts
         else:
-            # Instead, we may want to interpolate NaN values with
-            # extrapolation at the end of the node range. But, pandas does
-            # not currently support extrapolation
-            # See this issue:
-            # https://github.com/pandas-dev/pandas/issues/16284
-            # And this stalled PR:
-            # https://github.com/pandas-dev/pandas/pull/16513
-            # Until that's fixed, we can perform the interpolation column by
-            # column using the apply method. This is SLOW, but it does the job
-            def interp_linear_with_extrap(series):
-                """Linearly interpolate a series with extrapolation...
-
-                ...outside the series range
-                """
-                x = series[~series.isnull()].index.values
-                y = series[~series.isnull()].values
-                f = interp1d(x, y, kind="linear", fill_value="extrapolate")
-                return f(series.index)
-
-            # Apply the interpolation across all columns
-            interpolated = by_node_idx.apply(interp_linear_with_extrap)
-
-        # Now we have the NaN values filled in, we want to structure the nodes
-        # dataframe as a feature matrix with one row per subject and one
-        # column for each combination of metric, tractID, and nodeID
-        features = interpolated.stack(["subjectID", "tractID", "metric"]).unstack(
-            ["metric", "tractID", "nodeID"]
-        )
-
-        # We're almost there. It'd be nice if the multi-indexed columns were
-        # ordered well. So let's reorder the columns
-        new_columns = pd.MultiIndex.from_product(
-            features.columns.levels, names=["metric", "tractID", "nodeID"]
+            tensor = np.full(shape, np.nan)
+            tensor[index] = values
+
+        # We'd like to interpolate the missing values, but we don't want to
+        # interpolate from other subjects, tracts, or metrics. It should only
+        # interpolate from nearby nodes. So we view the tensor as a
+        # two-dimensional array with one row per fiber (i.e. per subject,
+        # metric, and tract) and one column per node and interpolate along
+        # each row. Without extrapolation, we treat the nodes as equally
+        # spaced, which is what pandas' `interpolate` method did by ignoring
+        # the index. With extrapolation, we use the nodeID values as the
+        # node positions, as `scipy.interpolate.interp1d` did.
+        # The tensor is private to this method, so we interpolate it in place.
+        positions = nodes if extrapolate else np.arange(n_nodes)
+        fibers = tensor.reshape(-1, n_nodes)
+        _interpolate_rows(fibers, np.asarray(positions, dtype=np.float64), extrapolate)
+
+        # Now we have the NaN values filled in, we want to structure the
+        # tensor as a feature matrix with one row per subject and one
+        # column for each combination of metric, tractID, and nodeID.
+        # Because the tensor axes are already in this order, this is just
+        # a reshape.
+        columns = pd.MultiIndex.from_product(
+            [metrics, tracts, nodes], names=["metric", "tractID", "nodeID"]
         )
 
-        features = features.loc[:, new_columns]
+        features = fibers.reshape(n_subjects, -1)
 
         # Lastly, there may still be some nan values. After interpolating
-        # above, the only NaN values left should be the one created after
-        # stacking and unstacking due to a subject missing an entire tract.
-        # In this case, for each missing column, we take the median value
-        # of all other subjects as the fillna value
-        features.fillna(features.median(), inplace=True)
-
-        # Construct bundle group membership
-        metric_level = features.columns.names.index("metric")
-        tract_level = features.columns.names.index("tractID")
-        n_tracts = len(features.columns.levels[tract_level])
-        bundle_group_membership = np.array(
-            features.columns.codes[metric_level].astype(np.int64) * n_tracts
-            + features.columns.codes[tract_level].astype(np.int64),
-            dtype=np.int64,
-        )
+        # above, the only NaN values left should be those due to a subject
+        # missing an entire tract. In this case, for each missing column,
+        # we take the median value of all other subjects as the fillna value
+        missing = np.isnan(features)
+        missing_cols = np.flatnonzero(missing.any(axis=0))
+        if missing_cols.size:
+            with warnings.catch_warnings():
+                # Columns with no valid values at all stay NaN
+                warnings.simplefilter("ignore", category=RuntimeWarning)
+                medians = np.nanmedian(features[:, missing_cols], axis=0)
+
+            features[:, missing_cols] = np.where(
+                missing[:, missing_cols], medians, features[:, missing_cols]
+            )
 
-        groups = [
-            np.where(bundle_group_membership == gid)[0]
-            for gid in np.unique(bundle_group_membership)
-        ]
+        # Construct bundle group membership. Because the columns are the
+        # product of metrics, tracts, and nodes (in that order), each
+        # metric-tract bundle is a contiguous block of `n_nodes` columns.
+        groups = list(
+            np.arange(n_metrics * n_tracts * n_nodes).reshape(
+                n_metrics * n_tracts, n_nodes
+            )
+        )
 
         if add_bias_feature:
-            bias_index = features.values.shape[1]
-            x = np.hstack([features.values, np.ones((features.values.shape[0], 1))])
+            # Allocate the full feature matrix once and fill it, rather than
+            # stacking a new column of ones onto a copy of the features
+            n_samples, bias_index = features.shape
+            x = np.empty((n_samples, bias_index + 1), dtype=features.dtype)
+            x[:, :bias_index] = features
+            x[:, bias_index] = 1.0
         else:
             bias_index = None
-            x = features.values
+            x = features
+
+        return x, groups, columns, bias_index
+
+
+def _unique_ids(values):
+    """Return the ordered unique values of an ID column and their indices
+
+    A categorical column keeps the order of its (observed) categories.
+    Other columns are sorted by value.
+
+    Parameters
+    ----------
+    values : pandas.Series
+        ID column, i.e. subjectID, tractID, or nodeID
+
+    Returns
+    -------
+    uniques : numpy.ndarray or pandas.Categorical
+        ordered unique values. For a categorical column, this is a
+        Categorical, so that `pd.MultiIndex.from_product` keeps the
+        category order in its levels.
+
+    inverse : numpy.ndarray
+        indices into `uniques` that reconstruct `values`
+    """
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        values = values.cat.remove_unused_categories()
+        uniques = pd.Categorical(values.cat.categories, dtype=values.dtype)
+        return uniques, values.cat.codes.to_numpy()
+
+    return np.unique(np.asarray(values), return_inverse=True)
+
 
-        return x, groups, features.columns, bias_index
+@numba.njit(parallel=True)
+def _interpolate_rows(fibers, nodes, extrapolate):
+    """Linearly interpolate NaN values in place along each row of `fibers`
+
+    This replaces column-wise calls to pandas' `interpolate` method or to
+    `scipy.interpolate.interp1d`. The rows are processed in parallel. We
+    don't use fastmath here because it assumes that there are no NaN values.
+
+    Parameters
+    ----------
+    fibers : numpy.ndarray
+        two-dimensional float64 array with one row per fiber and one column
+        per node. Rows without any valid values are left as NaN.
+
+    nodes : numpy.ndarray
+        float64 node positions corresponding to the columns of `fibers`
+
+    extrapolate : bool
+        If True, linearly extrapolate exterior NaN values using the first
+        (last) two valid values in each row. If False, forward(back)-fill
+        exterior NaN values with the nearest valid value.
+    """
+    n_fibers, n_nodes = fibers.shape
+    for i in numba.prange(n_fibers):
+        row = fibers[i]
+
+        # Find the first two and the last two valid nodes. If there is only
+        # one valid node, `second` and `penultimate` stay -1
+        first, second = -1, -1
+        for j in range(n_nodes):
+            if not np.isnan(row[j]):
+                if first < 0:
+                    first = j
+                else:
+                    second = j
+                    break
+
+        if first < 0:
+            # There are no valid nodes to interpolate from
+            continue
+
+        last, penultimate = -1, -1
+        for j in range(n_nodes - 1, -1, -1):
+            if not np.isnan(row[j]):
+                if last < 0:
+                    last = j
+                else:
+                    penultimate = j
+                    break
+
+        # Interior NaN values: interpolate between the valid nodes on
+        # either side of each run of NaN values
+        j = first + 1
+        while j < last:
+            if np.isnan(row[j]):
+                lo = j - 1
+                hi = j + 1
+                while np.isnan(row[hi]):
+                    hi += 1
+
+                slope = (row[hi] - row[lo]) / (nodes[hi] - nodes[lo])
+                for k in range(j, hi):
+                    row[k] = row[lo] + slope * (nodes[k] - nodes[lo])
+
+                j = hi
+
+            j += 1
+
+        # Exterior NaN values: extrapolate or fill from the nearest node
+        slope = 0.0
+        if extrapolate and second >= 0:
+            slope = (row[second] - row[first]) / (nodes[second] - nodes[first])
+        for k in range(first):
+            row[k] = row[first] + slope * (nodes[k] - nodes[first])
+
+        slope = 0.0
+        if extrapolate and penultimate >= 0:
+            slope = (row[last] - row[penultimate]) / (nodes[last] - nodes[penultimate])
+        for k in range(last + 1, n_nodes):
+            row[k] = row[last] + slope * (nodes[k] - nodes[last])
 
 
 def isiterable(obj):
-    """Return True if obj is an iterable, False otherwise."""
-    try:
-        _ = iter(obj)  # noqa F841
-    except TypeError:
-        return False
-    else:
-        return True
+    """Return True if obj is an iterable, False otherwise.
+
+    This checks for the iteration protocol instead of constructing an
+    iterator and catching the resulting TypeError. The protocol is looked up
+    on the type, as `iter` does, so that classes such as `list` are not
+    themselves considered iterable.
+    """
+    if isinstance(obj, np.ndarray):
+        # Zero-dimensional arrays define __iter__ but cannot be iterated over
+        return obj.ndim > 0
+
+    obj_type = type(obj)
+    return hasattr(obj_type, "__iter__") or hasattr(obj_type, "__getitem__")
 
 
 @registered
@@ -187,8 +329,10 @@ class GroupExtractor(BaseEstimator, TransformerMixin):
     ----
     Following
     http://scikit-learn.org/dev/developers/contributing.html
-    We do not do have any parameter validation in __init__. All logic behind
-    estimator parameters is done in transform.
+    We do not do have any parameter validation in __init__. The column mask
+    implied by the estimator parameters is computed in fit. If transform is
+    called without fitting first, the mask is computed from the current
+    parameters on every call.
     """
 
     def __init__(self, extract=None, groups=None):
@@ -196,29 +340,163 @@ class GroupExtractor(BaseEstimator, TransformerMixin):
         self.groups = groups
 
     def transform(self, x, *_):
-        if self.groups is not None and self.extract is not None:
-            if isiterable(self.extract):
-                extract = np.array(self.extract)
-            else:
-                extract = np.array([self.extract])
-
-            if isiterable(self.groups):
-                groups = np.array(self.groups)
-            else:
-                groups = np.array([self.groups])
-
-            try:
-                mask = np.isin(groups, extract)
-            except AttributeError:
-                mask = np.array([item in extract for item in groups])
+        # Support calling transform directly, without fitting first. Don't
+        # store the mask in that case, so that later changes to the
+        # parameters still take effect.
+        if hasattr(self, "mask_"):
+            mask = self.mask_
+        else:
+            mask = self._column_mask()
 
+        if mask is not None:
             return x[:, mask]
         else:
             return x
 
     def fit(self, *_):
+        # The column mask depends only on the estimator parameters, so we
+        # compute it once here rather than on every call to transform
+        self.mask_ = self._column_mask()
         return self
 
+    def _column_mask(self):
+        """Return a boolean mask of the columns in the extracted groups"""
+        if self.groups is not None and self.extract is not None:
+            return np.isin(np.atleast_1d(self.groups), np.atleast_1d(self.extract))
+        else:
+            return None
+
+
+def _label_encoding(label_sets):
+    """Return the (cached) LabelCodes for MultiIndex `label_sets`
+
+    Any other `label_sets` are returned unchanged.
+    """
+    if isinstance(label_sets, pd.MultiIndex):
+        return multicol2codes(label_sets)
+
+    return label_sets
+
+
+def _label_mask(label, label_sets):
+    """Return a boolean mask of the columns that have all items in `label`
+
+    Parameters
+    ----------
+    label : string or sequence
+        label for any level of the MultiIndex columns
+
+    label_sets : ndarray of sets, LabelCodes, or pandas.MultiIndex
+        Array of sets of labels for each column, the integer encoding of
+        those labels returned by `multicol2codes`, or the MultiIndex
+        columns themselves
+
+    Returns
+    -------
+    numpy.ndarray
+        boolean mask with one element for each column
+    """
+    label_sets = _label_encoding(label_sets)
+
+    if not isinstance(label_sets, LabelCodes):
+        return set(label) <= label_sets
+
+    codes, code_maps = label_sets
+    mask = np.ones(codes.shape[0], dtype=bool)
+    for item in set(label):
+        # An item may be a label in more than one level, e.g. a tract
+        # without a hemisphere is also its own symmetrized tract
+        item_mask = np.zeros(codes.shape[0], dtype=bool)
+        for level, code_map in enumerate(code_maps):
+            if item in code_map:
+                item_mask |= codes[:, level] == code_map[item]
+        mask &= item_mask
+
+    return mask
+
+
+def _labels_masks(labels, label_sets):
+    """Return a stacked boolean mask for each label in `labels`
+
+    Parameters
+    ----------
+    labels : iterable
+        labels for any level of the MultiIndex columns
+
+    label_sets : ndarray of sets, LabelCodes, or pandas.MultiIndex
+        Array of sets of labels for each column, the integer encoding of
+        those labels returned by `multicol2codes`, or the MultiIndex
+        columns themselves
+
+    Returns
+    -------
+    numpy.ndarray
+        boolean array with shape (n_labels, n_columns)
+    """
+    # Materialize `labels` once, in case it is an iterator
+    labels = list(labels)
+    label_sets = _label_encoding(label_sets)
+
+    n_columns = len(
+        label_sets.codes if isinstance(label_sets, LabelCodes) else label_sets
+    )
+
+    # Each row is a vectorized comparison over all columns. This is faster
+    # than a single broadcast comparison of all labels against an
+    # (n_labels, n_columns, n_levels) array, which mostly compares items to
+    # levels at which they are not labels.
+    masks = np.zeros((len(labels), n_columns), dtype=bool)
+    for idx, label in enumerate(labels):
+        masks[idx] = _label_mask(label, label_sets)
+
+    return masks
+
+
+def _any_label_mask(labels, label_sets):
+    """Return a boolean mask of the columns that belong to any label
+
+    Parameters
+    ----------
+    labels : iterable
+        labels for any level of the MultiIndex columns
+
+    label_sets : ndarray of sets, LabelCodes, or pandas.MultiIndex
+        Array of sets of labels for each column, the integer encoding of
+        those labels returned by `multicol2codes`, or the MultiIndex
+        columns themselves
+
+    Returns
+    -------
+    numpy.ndarray
+        boolean mask with one element for each column
+    """
+    # Materialize `labels` once, in case it is an iterator
+    labels = list(labels)
+    label_sets = _label_encoding(label_sets)
+
+    if not isinstance(label_sets, LabelCodes):
+        return _labels_masks(labels, label_sets).any(axis=0)
+
+    # Labels with a single item, e.g. ("fa",) or ("Left Uncinate",), are
+    # the most common. At each level, the columns that belong to any of
+    # them are found with one np.isin on that level's codes.
+    single_items, multi_labels = [], []
+    for label in labels:
+        items = set(label)
+        if len(items) == 1:
+            single_items.append(items.pop())
+        else:
+            multi_labels.append(label)
+
+    codes, code_maps = label_sets
+    mask = _labels_masks(multi_labels, label_sets).any(axis=0)
+    for level, code_map in enumerate(code_maps):
+        level_codes = [code_map[item] for item in single_items if item in code_map]
+        if level_codes:
+            mask |= np.isin(codes[:, level], level_codes)
+
+    return mask
+
 
 @registered
 def remove_group(x, remove_label, label_sets):
@@ -232,8 +510,11 @@ def remove_group(x, remove_label, label_sets):
     remove_label : string or sequence
         label for any level of the MultiIndex columns of `x`
 
-    label_sets : ndarray of sets
-        Array of sets of labels for each column of `x`
+    label_sets : ndarray of sets, LabelCodes, or pandas.MultiIndex
+        Array of sets of labels for each column of `x`, the integer
+        encoding of those labels returned by `multicol2codes`, or the
+        MultiIndex columns of `x`. A MultiIndex is encoded with
+        `multicol2codes` (including symmetrized tracts).
 
     Returns
     -------
@@ -245,12 +526,16 @@ def remove_group(x, remove_label, label_sets):
     multicol2sets
         function to convert a pandas MultiIndex into the sequence of sets
         expected for the parameter `label_sets`
+
+    multicol2codes
+        function to convert a pandas MultiIndex into the integer encoding
+        accepted for the parameter `label_sets`
     """
-    mask = np.logical_not(set(remove_label) <= label_sets)
+    mask = np.logical_not(_label_mask(remove_label, label_sets))
     if len(x.shape) == 2:
-        return np.copy(x[:, mask])
+        return x[:, mask]
     elif len(x.shape) == 1:
-        return np.copy(x[mask])
+        return x[mask]
     else:
         raise ValueError("`x` must be a one- or two-dimensional ndarray.")
 
@@ -267,8 +552,11 @@ def remove_groups(x, remove_labels, label_sets):
     remove_labels : sequence
         labels for any level of the MultiIndex columns of `x`
 
-    label_sets : ndarray of sets
-        Array of sets of labels for each column of `x`
+    label_sets : ndarray of sets, LabelCodes, or pandas.MultiIndex
+        Array of sets of labels for each column of `x`, the integer
+        encoding of those labels returned by `multicol2codes`, or the
+        MultiIndex columns of `x`. A MultiIndex is encoded with
+        `multicol2codes` (including symmetrized tracts).
 
     Returns
     -------
@@ -280,15 +568,19 @@ def remove_groups(x, remove_labels, label_sets):
     multicol2sets
         function to convert a pandas MultiIndex into the sequence of sets
         expected for the parameter `label_sets`
+
+    multicol2codes
+        function to convert a pandas MultiIndex into the integer encoding
+        accepted for the parameter `label_sets`
     """
-    mask = np.zeros_like(label_sets, dtype=np.bool)
-    for label in remove_labels:
-        mask = np.logical_or(mask, np.logical_not(set(label) <= label_sets))
+    # Keep the columns that are not in every group. Reduce first and then
+    # negate to avoid negating the full (n_labels, n_columns) mask
+    mask = np.logical_not(_labels_masks(remove_labels, label_sets).all(axis=0))
 
     if len(x.shape) == 2:
-        return np.copy(x[:, mask])
+        return x[:, mask]
     elif len(x.shape) == 1:
-        return np.copy(x[mask])
+        return x[mask]
     else:
         raise ValueError("`x` must be a one- or two-dimensional ndarray.")
 
@@ -305,8 +597,11 @@ def select_group(x, select_label, label_sets):
     select_label : string or sequence
         label for any level of the MultiIndex columns of `x`
 
-    label_sets : ndarray of sets
-        Array of sets of labels for each column of `x`
+    label_sets : ndarray of sets, LabelCodes, or pandas.MultiIndex
+        Array of sets of labels for each column of `x`, the integer
+        encoding of those labels returned by `multicol2codes`, or the
+        MultiIndex columns of `x`. A MultiIndex is encoded with
+        `multicol2codes` (including symmetrized tracts).
 
     Returns
     -------
@@ -318,12 +613,16 @@ def select_group(x, select_label, label_sets):
     multicol2sets
         function to convert a pandas MultiIndex into the sequence of sets
         expected for the parameter `label_sets`
+
+    multicol2codes
+        function to convert a pandas MultiIndex into the integer encoding
+        accepted for the parameter `label_sets`
     """
-    mask = set(select_label) <= label_sets
+    mask = _label_mask(select_label, label_sets)
     if len(x.shape) == 2:
-        return np.copy(x[:, mask])
+        return x[:, mask]
     elif len(x.shape) == 1:
-        return np.copy(x[mask])
+        return x[mask]
     else:
         raise ValueError("`x` must be a one- or two-dimensional ndarray.")
 
@@ -340,8 +639,11 @@ def select_groups(x, select_labels, label_sets):
     select_labels : sequence
         labels for any level of the MultiIndex columns of `x`
 
-    label_sets : ndarray of sets
-        Array of sets of labels for each column of `x`
+    label_sets : ndarray of sets, LabelCodes, or pandas.MultiIndex
+        Array of sets of labels for each column of `x`, the integer
+        encoding of those labels returned by `multicol2codes`, or the
+        MultiIndex columns of `x`. A MultiIndex is encoded with
+        `multicol2codes` (including symmetrized tracts).
 
     Returns
     -------
@@ -353,15 +655,17 @@ def select_groups(x, select_labels, label_sets):
     multicol2sets
         function to convert a pandas MultiIndex into the sequence of sets
         expected for the parameter `label_sets`
+
+    multicol2codes
+        function to convert a pandas MultiIndex into the integer encoding
+        accepted for the parameter `label_sets`
     """
-    mask = np.zeros_like(label_sets, dtype=np.bool)
-    for label in select_labels:
-        mask = np.logical_or(mask, set(label) <= label_sets)
+    mask = _any_label_mask(select_labels, label_sets)
 
     if len(x.shape) == 2:
-        return np.copy(x[:, mask])
+        return x[:, mask]
     elif len(x.shape) == 1:
-        return np.copy(x[mask])
+        return x[mask]
     else:
         raise ValueError("`x` must be a one- or two-dimensional ndarray.")
 
@@ -378,11 +682,15 @@ def shuffle_group(x, label, label_sets, random_seed=None):
     label : string or sequence
         label for any level of the MultiIndex columns of `x`
 
-    label_sets : ndarray of sets
-        Array of sets of labels for each column of `x`
+    label_sets : ndarray of sets, LabelCodes, or pandas.MultiIndex
+        Array of sets of labels for each column of `x`, the integer
+        encoding of those labels returned by `multicol2codes`, or the
+        MultiIndex columns of `x`. A MultiIndex is encoded with
+        `multicol2codes` (including symmetrized tracts).
 
-    random_seed : int, optional
-        Random seed for group shuffling
+    random_seed : int, RandomState instance, or None, optional
+        Random seed for group shuffling. If None, use the global numpy
+        random state.
         Default: None
 
     Returns
@@ -391,28 +699,49 @@ def shuffle_group(x, label, label_sets, random_seed=None):
         new feature matrix with all elements of group `shuffle_idx` permuted
     """
     out = np.copy(x)
-    mask = set(label) <= label_sets
-    section = out[:, mask]
-    section_shape = section.shape
-    section = section.flatten()
-
-    random_state = None
-    if random_seed is not None:
-        # Save random state to restore later
-        random_state = np.random.get_state()
-        # Set the random seed
-        np.random.seed(random_seed)
+    mask = _label_mask(label, label_sets)
 
-    np.random.shuffle(section)
+    # Boolean indexing along the second axis can return a Fortran-ordered
+    # array. np.compress always returns a new C-contiguous array, so we can
+    # shuffle a flat view of it in place without another copy
+    section = np.compress(mask, out, axis=1)
 
-    if random_seed is not None:
-        # Restore random state after shuffling
-        np.random.set_state(random_state)
+    # Use a local random state so that seeding does not change the global
+    # numpy random state
+    random_state = check_random_state(random_seed)
+    random_state.shuffle(section.reshape(-1))
 
-    out[:, mask] = section.reshape(section_shape)
+    out[:, mask] = section
     return out
 
 
+def _symmetrized_tract_codes(columns):
+    """Return symmetrized tract names and their codes for each column
+
+    The symmetrized name of a tract is its name with any "Left" or "Right"
+    removed. We only remove these from the unique tract names in the
+    MultiIndex levels and then use the MultiIndex codes to look up the
+    symmetrized name for each column.
+
+    Parameters
+    ----------
+    columns : pandas.MultiIndex
+        multi-indexed columns with a "tractID" level
+
+    Returns
+    -------
+    sym_levels : numpy.ndarray
+        sorted unique symmetrized tract names
+
+    sym_codes : numpy.ndarray
+        index into `sym_levels` for each column
+    """
+    tract_idx = columns.names.index("tractID")
+    symmetrized = columns.levels[tract_idx].str.replace(r"Left |Right ", "", regex=True)
+    sym_levels, level_codes = np.unique(np.asarray(symmetrized), return_inverse=True)
+    return sym_levels, level_codes[columns.codes[tract_idx]]
+
+
 @registered
 def multicol2sets(columns, tract_symmetry=True):
     """Convert a pandas MultiIndex to an array of sets
@@ -433,26 +762,46 @@ def multicol2sets(columns, tract_symmetry=True):
     col_sets : numpy.ndarray
         An array of sets containing the tuples of the input MultiIndex
     """
-    col_vals = columns.to_numpy()
-
     if tract_symmetry:
-        tract_idx = columns.names.index("tractID")
-
-        bilateral_symmetry = {
-            tract: tract.replace("Left ", "").replace("Right ", "")
-            for tract in columns.levels[tract_idx]
-        }
+        sym_levels, sym_codes = _symmetrized_tract_codes(columns)
 
-        col_vals = np.array([x + (bilateral_symmetry[x[tract_idx]],) for x in col_vals])
+        # Stacking the labels into one array converts them all (including
+        # the nodeIDs) to strings
+        col_vals = np.column_stack(
+            [columns.to_frame(index=False).to_numpy(), sym_levels[sym_codes]]
+        ).astype(str)
+    else:
+        col_vals = columns.to_numpy()
 
-    col_sets = np.array(list(map(lambda c: set(c), col_vals)))
+    # numpy can't vectorize set construction, so fill a preallocated object
+    # array rather than building a list of sets and converting it. Iterating
+    # over `tolist()` avoids creating a numpy scalar for every label.
+    col_sets = np.empty(len(col_vals), dtype=object)
+    for idx, vals in enumerate(col_vals.tolist()):
+        col_sets[idx] = set(vals)
 
     return col_sets
 
 
+def _same_levels_and_codes(levels, codes, other_levels, other_codes):
+    """Return True if two sets of MultiIndex levels and codes are equal"""
+    return (
+        len(levels) == len(other_levels)
+        and len(codes) == len(other_codes)
+        and all(level.equals(other) for level, other in zip(levels, other_levels))
+        and all(np.array_equal(c, other) for c, other in zip(codes, other_codes))
+    )
+
+
 @registered
-def multicol2dicts(columns, tract_symmetry=True):
-    """Convert a pandas MultiIndex to an array of dicts
+def multicol2codes(columns, tract_symmetry=True):
+    """Convert a pandas MultiIndex to an integer encoding of its labels
+
+    This is a columnar alternative to `multicol2sets`. Rather than storing
+    a set of labels for each column, we store the integer code of each
+    column's label at each level of the MultiIndex. Selection functions
+    that accept the output of `multicol2sets` also accept this encoding and
+    use vectorized comparisons instead of set operations on each column.
 
     Parameters
     ----------
@@ -460,34 +809,100 @@ def multicol2dicts(columns, tract_symmetry=True):
         multi-indexed columns used to generate the result
 
     tract_symmetry : boolean, optional
-        If True, then another tract item will be added to each set
-        if the set contains a tract containing "Left" or "Right."
-        The added tract will be the more general (i.e. symmetrized) name.
+        If True, then another level will be added to the encoding
+        containing the more general (i.e. symmetrized) name of each tract
+        containing "Left" or "Right."
         Default: True
 
     Returns
     -------
-    col_dicts : numpy.ndarray
-        An array of dicts containing the tuples of the input MultiIndex
+    LabelCodes
+        namedtuple with fields:
+        codes - read-only integer array with shape (n_columns, n_levels)
+            containing the code of each column's label at each level
+        code_maps - list with one dict per level mapping labels to codes.
+            If `tract_symmetry` is True, the labels are converted to strings,
+            as they are by `multicol2sets`, e.g. nodeID 5 becomes "5"
+
+    Note
+    ----
+    The result is cached on `columns`, so repeated calls with the same
+    MultiIndex return the same (shared) LabelCodes. The cache is refreshed
+    if the levels or codes of `columns` are later set in place. The codes
+    array is read-only, but the code_maps dicts are shared by every caller
+    and must not be modified.
     """
-    col_vals = columns.to_numpy()
-    col_names = columns.names
+    # We cache the encoding on the MultiIndex so that the many selections
+    # made with the same columns (e.g. across cross-validation splits) only
+    # encode them once. The levels and codes of a MultiIndex can still be
+    # replaced in place, so we keep the levels and codes that the cached
+    # encodings were computed from and start over if their contents have
+    # changed. Comparing contents, rather than object identity, doesn't
+    # depend on how pandas stores them. The level names are not part of
+    # the encoding.
+    levels = list(columns.levels)
+    level_codes = [np.asarray(codes) for codes in columns.codes]
+    cached = getattr(columns, "_afq_label_codes", None)
+    if cached is None or not _same_levels_and_codes(
+        cached[0], cached[1], levels, level_codes
+    ):
+        cached = (levels, level_codes, {})
+        columns._afq_label_codes = cached
+
+    cache = cached[2]
+    if tract_symmetry in cache:
+        return cache[tract_symmetry]
+
+    codes = list(level_codes)
+    if tract_symmetry:
+        # `multicol2sets` converts all labels (including the nodeIDs) to
+        # strings when adding the symmetrized tracts. Key the code maps by
+        # the same strings so that both encodings select the same columns.
+        levels = [np.asarray(level).astype(str).tolist() for level in levels]
+
+    code_maps = [{label: code for code, label in enumerate(level)} for level in levels]
 
     if tract_symmetry:
-        tract_idx = columns.names.index("tractID")
+        sym_levels, sym_codes = _symmetrized_tract_codes(columns)
+        codes.append(sym_codes)
+        code_maps.append({label: code for code, label in enumerate(sym_levels)})
 
-        bilateral_symmetry = {
-            tract: tract.replace("Left ", "").replace("Right ", "")
-            for tract in columns.levels[tract_idx]
-        }
+    codes = np.stack(codes, axis=1).astype(np.int32)
+    codes.setflags(write=False)
 
-        col_vals = np.array([x + (bilateral_symmetry[x[tract_idx]],) for x in col_vals])
+    cache[tract_symmetry] = LabelCodes(codes=codes, code_maps=code_maps)
+    return cache[tract_symmetry]
 
-        col_names = list(col_names) + ["symmetrized_tractID"]
 
-    col_dicts = np.array([dict(zip(col_names, vals)) for vals in col_vals])
+@registered
+def multicol2dicts(columns, tract_symmetry=True):
+    """Convert a pandas MultiIndex to an array of dict-like records
 
-    return col_dicts
+    Parameters
+    ----------
+    columns : pandas.MultiIndex
+        multi-indexed columns used to generate the result
+
+    tract_symmetry : boolean, optional
+        If True, then another "symmetrized_tractID" field will be added to
+        each record containing the more general (i.e. symmetrized) name of
+        tracts containing "Left" or "Right."
+        Default: True
+
+    Returns
+    -------
+    col_dicts : numpy.recarray
+        A record array with one record per column of the input MultiIndex.
+        The record fields are the level names, so that each record can be
+        accessed like a dict, e.g. ``col_dicts[0]["tractID"]``
+    """
+    col_frame = columns.to_frame(index=False)
+
+    if tract_symmetry:
+        sym_levels, sym_codes = _symmetrized_tract_codes(columns)
+        col_frame["symmetrized_tractID"] = sym_levels[sym_codes]
+
+    return col_frame.to_records(index=False)
 
 
 @registered
@@ -496,23 +911,29 @@ def sort_features(features, scores):
 
     Parameters
     ----------
-    features : sequence of features
+    features : iterable of features
         Sequence of features, can be the returned values from multicol2sets
         or multicol2dicts
 
-    scores : sequence of scores
+    scores : iterable of scores
         importance scores for each feature
 
     Returns
     -------
     list
-        Sorted list of columns and scores
+        List of (feature, score) tuples, sorted in descending order by the
+        absolute value of the score
     """
-    res = sorted(
-        [(feat, score) for feat, score in zip(features, scores)],
-        key=lambda s: np.abs(s[1]),
-        reverse=True,
-    )
+    # Accept any iterable (e.g. generators, dict views, or pandas Series with
+    # an arbitrary index) and return the caller's own score objects
+    features = list(features)
+    scores = list(scores)
+
+    # A stable sort on the negated magnitudes keeps tied features in their
+    # original order
+    order = np.argsort(-np.abs(np.asarray(scores)), kind="mergesort")
+
+    res = [(features[idx], scores[idx]) for idx in order]
 
     return res
 
@@ -594,18 +1015,18 @@ def beta_hat_by_groups(beta_hat, columns, drop_zeros=False):
     """
     betas = OrderedDict()
 
-    label_sets = multicol2sets(columns, tract_symmetry=False)
+    tract_level = columns.names.index("tractID")
+    metric_level = columns.names.index("metric")
+    tract_codes = np.asarray(columns.codes[tract_level])
+    metric_codes = np.asarray(columns.codes[metric_level])
+    metric_names = columns.levels[metric_level]
 
-    for tract in columns.levels[columns.names.index("tractID")]:
-        all_metrics = select_group(
-            x=beta_hat, select_label=(tract,), label_sets=label_sets
-        )
-        if not drop_zeros or any(all_metrics != 0):
+    for tract_code, tract in enumerate(columns.levels[tract_level]):
+        tract_mask = tract_codes == tract_code
+        if not drop_zeros or any(beta_hat[tract_mask] != 0):
             betas[tract] = OrderedDict()
-            for metric in columns.levels[columns.names.index("metric")]:
-                x = select_group(
-                    x=beta_hat, select_label=(tract, metric), label_sets=label_sets
-                )
+            for metric_code, metric in enumerate(metric_names):
+                x = beta_hat[tract_mask & (metric_codes == metric_code)]
                 if not drop_zeros or any(x != 0):
                     betas[tract][metric] = x
 
@@ -647,18 +1068,31 @@ def unfold_beta_hat_by_metrics(beta_hat, columns, tract_names=None):
     """
     betas = OrderedDict()
 
-    betas_by_groups = beta_hat_by_groups(beta_hat, columns, drop_zeros=False)
-
     if tract_names is not None:
         tracts = tract_names
     else:
         tracts = canonical_tract_names
 
-    for metric in columns.levels[columns.names.index("metric")]:
-        betas[metric] = []
-        for tract in tracts:
-            betas[metric].append(betas_by_groups[tract][metric])
+    tract_level = columns.names.index("tractID")
+    metric_level = columns.names.index("metric")
 
-        betas[metric] = np.concatenate(betas[metric])
+    tract_codes = columns.levels[tract_level].get_indexer(tracts)
+    if np.any(tract_codes < 0):
+        raise KeyError(tracts[np.flatnonzero(tract_codes < 0)[0]])
+
+    # Collect the column indices of each tract in `tracts` order, once for
+    # all metrics. A tract that is repeated in `tracts` is repeated here.
+    column_tract_codes = np.asarray(columns.codes[tract_level])
+    tract_idx = np.concatenate(
+        [np.flatnonzero(column_tract_codes == code) for code in tract_codes]
+    )
+    metric_codes = np.asarray(columns.codes[metric_level])[tract_idx]
+
+    # For each metric, gather the coefficients in tract order in one step
+    # rather than concatenating the coefficients for each tract. Within
+    # each tract, the columns keep their original (i.e. node) order.
+    for metric_code, metric in enumerate(columns.levels[metric_level]):
+        idx = tract_idx[metric_codes == metric_code]
+        betas[metric] = beta_hat[idx]
 
     return betas
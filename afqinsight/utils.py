@@ -1,5 +1,3 @@
-from __future__ import absolute_import, division, print_function
-
 import numpy as np
 import matplotlib.pyplot as plt
 from collections import namedtuple
@@ -1,5 +1,3 @@
-from __future__ import absolute_import, division, print_function
-
 from os.path import join as pjoin
 
 # Format expected by setup.py and doc/source/conf.py: string of form "X.Y.Z"
@@ -70,6 +68,7 @@ PACKAGE_DATA = {"afqinsight": [pjoin("data", "*", "*")]}
 REQUIRES = [
     "copt==0.8.4",
     "numpy>=1.16.3",
+    "numba>=0.44.0",
     "pandas>=0.22.0",
     "tables",
     "scipy>=1.0.0",